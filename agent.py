@@ -1,25 +1,75 @@
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
 from nearai.agents.environment import Environment
+import hashlib
 import json
 import os
+import random
+import re
+import threading
+import time
+from cache import PARSED_MESSAGES
+from serialization import loads
 from formatters import MarkdownRecipeFormatter, RecipeFormatter
-from recipes import SpoonacularRecipeProvider, RecipeProvider
+from recipes import Recipe, SpoonacularRecipeProvider, RecipeProvider
 import logging
 
 
+RECIPES_SEPARATOR = "\n---\n"
+
+RETRY_INITIAL_DELAY_SECONDS = 0.1
+RETRY_MAX_DELAY_SECONDS = 2.0
+
+STRING_LIST_SCHEMA = {"type": "array", "items": {"type": "string"}}
+
+PREFERENCE_LIST_FIELDS = (
+    "include_ingredients",
+    "exclude_ingredients",
+    "include_cuisines",
+    "exclude_cuisines",
+)
+
+# filler words that never make a useful speculative recipe query
+QUERY_STOPWORDS = frozenset(
+    "about and any are can cook easy find for give have hello help hey how make "
+    "need please quick recipe recipes show some something the there want what "
+    "who with you your".split()
+)
+
+
+class RecipePrefetch:
+    """Fetches recipes for a guessed query on a background thread."""
+
+    def __init__(self, provider: RecipeProvider, query: str):
+        self.query = query
+        self._recipes: Optional[List[Recipe]] = None
+        self._error: Optional[Exception] = None
+        # a daemon thread, so an unused prefetch never keeps the process alive
+        self._thread = threading.Thread(
+            target=self._fetch, args=(provider,), daemon=True
+        )
+        self._thread.start()
+
+    def _fetch(self, provider: RecipeProvider):
+        try:
+            self._recipes = provider.fetch_recipes(query=self.query, max_amount=5)
+        except Exception as error:
+            self._error = error
+
+    def result(self) -> List[Recipe]:
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+        return self._recipes
+
+
 class Agent:
-    def __init__(
-        self, client: Environment, provider: RecipeProvider, formatter: RecipeFormatter
-    ):
-        self.client = client
-        self.recipe_provider = provider
-        self.formatter = formatter
+    # parsed preferences keyed by the normalized user message, shared between turns
+    _parsed_messages = PARSED_MESSAGES
 
-    @property
-    def system_prompt(self) -> dict[str, str]:
-        return {
-            "role": "system",
-            "content": """You are an AI assistant for a cooking recipes application. Your task is to extract as much specific information as possible from the user's natural language query and structure it into a JSON object. The JSON object should include:
+    _SYSTEM_PROMPT = {
+        "role": "system",
+        "content": """You are an AI assistant for a cooking recipes application. Your task is to extract as much specific information as possible from the user's natural language query and structure it into a JSON object. The JSON object should include:
 
                     "include_ingredients": A list of ingredients that should/must be used in the recipes.
                     "exclude_ingredients": A list of ingredients or ingredient types that the recipes must not contain.
@@ -30,19 +80,94 @@ class Agent:
                 
                     Your response is just a valid JSON object and no other text.
                     If a user asks about your abilities, capabilities, or functionality, respond with a structured JSON object containing a single key, "message". This key should include a concise and friendly description of your skill which is to provide a user with a list of personalized recipes to cook at home, tailored to their preferences and requirements.""",
-        }
+    }
+
+    # constrains decoding so the model returns valid JSON by construction
+    _RESPONSE_FORMAT = {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "recipe_preferences",
+            "schema": {
+                "type": "object",
+                "properties": {
+                    "include_ingredients": STRING_LIST_SCHEMA,
+                    "exclude_ingredients": STRING_LIST_SCHEMA,
+                    "include_cuisines": STRING_LIST_SCHEMA,
+                    "exclude_cuisines": STRING_LIST_SCHEMA,
+                    "query": {"type": "string"},
+                    "message": {"type": "string"},
+                },
+                "additionalProperties": False,
+            },
+        },
+    }
+
+    def __init__(
+        self, client: Environment, provider: RecipeProvider, formatter: RecipeFormatter
+    ):
+        self.client = client
+        self.recipe_provider = provider
+        self.formatter = formatter
+
+    @staticmethod
+    def _message_cache_key(message: dict[str, str]) -> str:
+        normalized = " ".join(message["content"].lower().split())
+        return hashlib.blake2b(normalized.encode()).hexdigest()
+
+    def _cached_parse(
+        self, message: dict[str, str]
+    ) -> Optional[dict[str, str | List[str]]]:
+        return self._parsed_messages.get(self._message_cache_key(message))
+
+    def _cache_parse(
+        self, message: dict[str, str], parsed_params: dict[str, str | List[str]]
+    ):
+        self._parsed_messages.set(self._message_cache_key(message), parsed_params)
+
+    @staticmethod
+    def _is_valid_params(parsed) -> bool:
+        if not isinstance(parsed, dict):
+            return False
+        if isinstance(parsed.get("message"), str):
+            return True
+
+        query = parsed.get("query")
+        return (query is None or isinstance(query, str)) and all(
+            isinstance(parsed.get(field, []), list) for field in PREFERENCE_LIST_FIELDS
+        )
 
     def parse_user_message(self, message: dict[str, str]) -> dict[str, str | List[str]]:
-        completion = self.client.completion([self.system_prompt, message])
+        cached = self._cached_parse(message)
+        if cached is not None:
+            self.client.add_agent_log(
+                "Reusing cached parse of user message", level=logging.DEBUG
+            )
+            return cached
+
+        completion = self.client.completion(
+            [Agent._SYSTEM_PROMPT, message], response_format=Agent._RESPONSE_FORMAT
+        )
 
         self.client.add_agent_log(completion)
 
-        return json.loads(completion)
+        parsed = loads(completion)
 
+        # valid JSON of the wrong shape is retried like malformed output
+        if not self._is_valid_params(parsed):
+            raise json.JSONDecodeError(
+                "Completion is not a recipe preferences object", completion, 0
+            )
+
+        return parsed
+
+    # backends ignoring response_format may still return non-JSON, so keep retrying
     def parse_user_message_with_retries(
         self, message: dict[str, str], attempts: int = 3
     ) -> dict[str, str | List[str]]:
-        for attempt in range(3):
+        if attempts < 1:
+            raise ValueError(f"attempts must be at least 1, got {attempts}")
+
+        for attempt in range(attempts):
             try:
                 self.client.add_agent_log(
                     f"Attempt #{attempt + 1} to parse user message", level=logging.DEBUG
@@ -50,6 +175,12 @@ class Agent:
                 return self.parse_user_message(message)
             except json.decoder.JSONDecodeError as error:
                 if attempt < attempts - 1:
+                    # exponential backoff with full jitter lets transient model hiccups settle
+                    delay = min(
+                        RETRY_MAX_DELAY_SECONDS,
+                        RETRY_INITIAL_DELAY_SECONDS * 2**attempt,
+                    )
+                    time.sleep(random.uniform(0, delay))
                     continue
                 else:
                     raise error
@@ -57,7 +188,32 @@ class Agent:
             except Exception as error:
                 raise error
 
+    @staticmethod
+    def _guess_query(message: dict[str, str]) -> str:
+        for word in re.findall(r"[a-z]+", message["content"].lower()):
+            if len(word) > 2 and word not in QUERY_STOPWORDS:
+                return word
+        return ""
+
+    def _prefetch_recipes(
+        self, user_message: dict[str, str]
+    ) -> Optional[RecipePrefetch]:
+        # a cached parse returns instantly, so there is no model latency to hide
+        if self._cached_parse(user_message) is not None:
+            return None
+
+        query = self._guess_query(user_message)
+        if not query:
+            return None
+
+        self.client.add_agent_log(
+            f"Prefetching recipes for guessed query '{query}'", level=logging.DEBUG
+        )
+        return RecipePrefetch(self.recipe_provider, query)
+
     def __run(self, user_message: dict[str, str]):
+        # start fetching recipes for a guessed query while the model parses the message
+        prefetched = self._prefetch_recipes(user_message)
         parsed_params = self.parse_user_message_with_retries(user_message, attempts=3)
 
         self.client.add_agent_log(
@@ -66,21 +222,58 @@ class Agent:
 
         message = parsed_params.get("message")
         if isinstance(message, str):
+            self._cache_parse(user_message, parsed_params)
             return self.client.add_reply(message)
 
         self.client.add_reply("Preparing recipes to match your taste")
 
-        recipes = self.recipe_provider.fetch_recipes(
-            query=parsed_params.get("query", ""),
-            include_ingredients=parsed_params.get("include_ingredients", []),
-            exclude_ingredients=parsed_params.get("exclude_ingredients", []),
-            include_cuisines=parsed_params.get("include_cuisines", []),
-            exclude_cuisines=parsed_params.get("exclude_cuisines", []),
-            max_amount=5,
+        query = parsed_params.get("query")
+        # normalized once so the prefetch match, the search and its cache key all agree
+        query = query.strip().lower() if isinstance(query, str) else ""
+        include_ingredients = parsed_params.get("include_ingredients", [])
+        exclude_ingredients = parsed_params.get("exclude_ingredients", [])
+        include_cuisines = parsed_params.get("include_cuisines", [])
+        exclude_cuisines = parsed_params.get("exclude_cuisines", [])
+
+        # the prefetch only searched by query, so it's reusable when nothing else narrows the search
+        prefetch_matches = (
+            prefetched is not None
+            and query == prefetched.query
+            and not include_ingredients
+            and not exclude_ingredients
+            and not include_cuisines
+            and not exclude_cuisines
         )
 
+        recipes = None
+        if prefetch_matches:
+            try:
+                recipes = prefetched.result()
+                self.client.add_agent_log(
+                    "Reusing prefetched recipes", level=logging.DEBUG
+                )
+            except Exception as error:
+                # a failed guess must not fail the turn, fall back to the regular search
+                self.client.add_agent_log(
+                    f"Prefetch failed, fetching again: {error}", level=logging.WARNING
+                )
+
+        if recipes is None:
+            recipes = self.recipe_provider.fetch_recipes(
+                query=query,
+                include_ingredients=include_ingredients,
+                exclude_ingredients=exclude_ingredients,
+                include_cuisines=include_cuisines,
+                exclude_cuisines=exclude_cuisines,
+                max_amount=5,
+            )
+
+        # only cache params that produced a successful search
+        self._cache_parse(user_message, parsed_params)
+
+        # titles are enough to trace a turn, full recipes are sent in the reply anyway
         self.client.add_agent_log(
-            f"Fetched {len(recipes)} recipes: {[str(recipe) for recipe in recipes]}"
+            f"Fetched {len(recipes)} recipes: {[recipe.title for recipe in recipes]}"
         )
 
         if len(recipes) == 0:
@@ -90,9 +283,11 @@ class Agent:
 
         self.client.add_reply(f"Found {len(recipes)} recipes for you")
 
-        for recipe in recipes:
-            text = self.formatter.transform_to_text(recipe)
-            self.client.add_reply(text)
+        # formatters may grow I/O (image or nutrition lookups), so format recipes concurrently
+        with ThreadPoolExecutor(max_workers=len(recipes)) as executor:
+            texts = list(executor.map(self.formatter.transform_to_text, recipes))
+
+        self.client.add_reply(RECIPES_SEPARATOR.join(texts))
 
     def run(self, user_message: dict[str, str]):
         try:
@@ -0,0 +1,41 @@
+from collections import OrderedDict
+import threading
+import time
+from typing import Any, Hashable, Optional
+
+
+class TTLCache:
+    """Thread-safe in-memory LRU cache whose entries expire after `ttl` seconds."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+# agent.py is re-executed on every turn, so caches that must outlive a single turn
+# have to live in an imported module like this one
+PARSED_MESSAGES = TTLCache(maxsize=10_000, ttl=3600)
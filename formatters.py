@@ -13,34 +13,31 @@ class RecipeFormatter:
 
 
 class MarkdownRecipeFormatter(RecipeFormatter):
+    _INGREDIENTS_HEADER = "| Ingredient | Image |\n|------------|-------|\n"
+
     def transform_to_text(self, recipe):
-        bulletpoints = [
+        ingredient_rows = "\n".join(
             f"| {ingredient.title} | ![{ingredient.title}]({ingredient.image}) |"
             for ingredient in recipe.ingredients
-        ]
-        ingredient_bulletpoints = "\n".join(bulletpoints)
-        ingredient_table = f"""
-| Ingredient | Image |
-|------------|-------|
-{ingredient_bulletpoints}
-"""
-
-        steps = [
-            f"{idx + 1}. {instruction.step}"
-            for idx, instruction in enumerate(recipe.instructions)
-        ]
-        instruction_steps = "\n".join(steps)
-
-        return f"""
-### {recipe.title}
-
-Likes: {recipe.likes}
-
-![Recipe Image]({recipe.image})
-
-##### Ingredients
-{ingredient_table}
-
-##### Steps
-{instruction_steps}
-"""
+        )
+        instruction_steps = "\n".join(
+            f"{idx}. {instruction.step}"
+            for idx, instruction in enumerate(recipe.instructions, start=1)
+        )
+
+        return "".join(
+            (
+                "\n### ",
+                str(recipe.title),
+                "\n\nLikes: ",
+                str(recipe.likes),
+                "\n\n![Recipe Image](",
+                str(recipe.image),
+                ")\n\n##### Ingredients\n\n",
+                self._INGREDIENTS_HEADER,
+                ingredient_rows,
+                "\n\n\n##### Steps\n",
+                instruction_steps,
+                "\n",
+            )
+        )
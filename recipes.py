@@ -1,22 +1,44 @@
 from abc import abstractmethod
+from functools import lru_cache
+import hashlib
+import json
 import requests
-from typing import List
+from requests.adapters import HTTPAdapter
+from typing import List, Optional, Sequence, Tuple
+from cache import TTLCache
+from serialization import dumps, loads
+
+REQUEST_TIMEOUT_SECONDS = 10.0
+
+# shared session keeps connections alive, so warm calls skip the TCP+TLS handshake
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(pool_connections=10, pool_maxsize=20))
+
+
+@lru_cache(maxsize=1024)
+def _join(values: tuple[str, ...]) -> str:
+    return ",".join(values)
+
+
+def _maybe_join(key: str, values: List[str]) -> dict[str, str]:
+    # empty filters are omitted instead of being sent as "key="
+    return {key: _join(tuple(values))} if values else {}
 
 
 class RecipeIngredient:
+    __slots__ = ("title", "image")
+
     def __init__(self, title: str, image: str):
         self.title = title
         self.image = image
 
     def __str__(self):
-        json = {
-            "title": self.title,
-            "image": self.image,
-        }
-        return str(json)
+        return dumps({"title": self.title, "image": self.image})
 
 
 class RecipeInstruction:
+    __slots__ = ("step",)
+
     def __init__(self, step: str):
         self.step = step
 
@@ -25,29 +47,36 @@ class RecipeInstruction:
 
 
 class Recipe:
+    __slots__ = ("title", "likes", "image", "ingredients", "instructions")
+
     def __init__(
         self,
         title: str,
         likes: int,
         image: str,
-        ingredients: List[RecipeIngredient],
-        instructions: List[RecipeInstruction],
+        ingredients: Sequence[RecipeIngredient],
+        instructions: Sequence[RecipeInstruction],
     ):
         self.title = title
         self.likes = likes
         self.image = image
-        self.ingredients = ingredients
-        self.instructions = instructions
+        # immutable tuples are a single compact allocation for the formatter to walk
+        self.ingredients: Tuple[RecipeIngredient, ...] = tuple(ingredients)
+        self.instructions: Tuple[RecipeInstruction, ...] = tuple(instructions)
 
     def __str__(self):
-        json = {
-            "title": self.title,
-            "likes": self.likes,
-            "image": self.image,
-            "ingredients": [str(ingredient) for ingredient in self.ingredients],
-            "instructions": [str(instruction) for instruction in self.instructions],
-        }
-        return str(json)
+        return dumps(
+            {
+                "title": self.title,
+                "likes": self.likes,
+                "image": self.image,
+                "ingredients": [
+                    {"title": ingredient.title, "image": ingredient.image}
+                    for ingredient in self.ingredients
+                ],
+                "instructions": [instruction.step for instruction in self.instructions],
+            }
+        )
 
 
 class RecipeProvider:
@@ -65,9 +94,50 @@ class RecipeProvider:
 
 
 class SpoonacularRecipeProvider(RecipeProvider):
+    # recipe search results rarely change, keep them around for a day
+    _responses = TTLCache(maxsize=2048, ttl=86400)
+
+    _BASE_PARAMS = {
+        "instructionsRequired": "true",
+        "addRecipeInformation": "true",
+        "addRecipeNutrition": "false",
+        "fillIngredients": "true",
+        "ignorePantry": "true",
+        "sort": "calories",
+        "sortDirection": "desc",
+    }
+
     def __init__(self, apiKey: str):
         self.API_URL = "https://api.spoonacular.com/recipes/complexSearch"
         self.API_KEY = apiKey
+        self._base_params = {**self._BASE_PARAMS, "apiKey": self.API_KEY}
+
+    @staticmethod
+    def _parse_recipe(raw: dict[str, any]) -> Optional[Recipe]:
+        # read only the fields the agent uses, Spoonacular sends dozens more per recipe
+        title = raw.get("title")
+        if not title:
+            return None
+
+        # missing ingredient or instruction lists are common and must not sink the batch
+        ingredients = tuple(
+            RecipeIngredient(ingredient.get("original"), ingredient.get("image"))
+            for key in ("missedIngredients", "usedIngredients")
+            for ingredient in raw.get(key) or ()
+        )
+        instructions = tuple(
+            RecipeInstruction(instruction.get("step"))
+            for instructions_group in raw.get("analyzedInstructions") or ()
+            for instruction in instructions_group.get("steps") or ()
+        )
+
+        return Recipe(
+            title,
+            raw.get("likes"),
+            raw.get("image"),
+            ingredients,
+            instructions,
+        )
 
     def fetch_recipes(
         self,
@@ -79,50 +149,39 @@ class SpoonacularRecipeProvider(RecipeProvider):
         max_amount: int = 5,
     ):
         params = {
+            **self._base_params,
             "query": query,
-            "cuisine": ",".join(include_cuisines),
-            "excludeCuisine": ",".join(exclude_cuisines),
-            "includeIngredients": ",".join(include_ingredients),
-            "excludeIngredients": ",".join(exclude_ingredients),
+            **_maybe_join("cuisine", include_cuisines),
+            **_maybe_join("excludeCuisine", exclude_cuisines),
+            **_maybe_join("includeIngredients", include_ingredients),
+            **_maybe_join("excludeIngredients", exclude_ingredients),
             "number": max_amount,
-            "apiKey": self.API_KEY,
-            "instructionsRequired": "true",
-            "addRecipeInformation": "true",
-            "addRecipeNutrition": "false",
-            "fillIngredients": "true",
-            "ignorePantry": "true",
-            "sort": "calories",
-            "sortDirection": "desc",
         }
 
+        cache_key = hashlib.sha1(
+            json.dumps(params, sort_keys=True).encode()
+        ).hexdigest()
+
+        cached = self._responses.get(cache_key)
+        if cached is not None:
+            return list(cached)
+
         # Make the GET request to the Spoonacular API
-        response = requests.get(self.API_URL, params=params)
+        response = _SESSION.get(
+            self.API_URL, params=params, timeout=REQUEST_TIMEOUT_SECONDS
+        )
 
-        json_response: dict[str, any] = response.json()
+        json_response: dict[str, any] = loads(response.content)
 
         if response.status_code == 200:
             recipes = json_response.get("results", [])
 
-            return [
-                Recipe(
-                    recipe.get("title"),
-                    recipe.get("likes"),
-                    recipe.get("image"),
-                    [
-                        RecipeIngredient(
-                            ingredient.get("original"), ingredient.get("image")
-                        )
-                        for ingredient in recipe["missedIngredients"]
-                        + recipe["usedIngredients"]
-                    ],
-                    [
-                        RecipeInstruction(instruction.get("step"))
-                        for instructions in recipe["analyzedInstructions"]
-                        for instruction in instructions["steps"]
-                    ],
-                )
-                for recipe in recipes
+            result = [
+                recipe for recipe in map(self._parse_recipe, recipes) if recipe
             ]
+            self._responses.set(cache_key, result)
+
+            return list(result)
         else:
             raise Exception(
                 f'Error fetching recipes: {response.status_code} {json_response.get("message", "Unknown error")}'
@@ -0,0 +1,24 @@
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def loads(data: str | bytes):
+    """Decode JSON with orjson when it's available.
+
+    orjson.JSONDecodeError subclasses json.JSONDecodeError, so callers
+    handle decode failures the same way with either backend.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(data) -> str:
+    """Encode JSON to a str with orjson when it's available."""
+    if orjson is not None:
+        return orjson.dumps(data).decode()
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False)